@@ -3,6 +3,7 @@
 #========= COMMAND LINE INTERFACE =========
 
 import argparse
+import os
 from pathlib import Path
 
 DESCRIPTION = """Browse C++20 sources and build it.
@@ -41,9 +42,14 @@ parser.add_argument('--patterns-', dest='patternsMinus', help='Patterns to exclu
 parser.add_argument('--headers', help='Patterns to determine which files are not for compilation. (headers)',
                     default='*.h,*.hpp,*.hxx')
 parser.add_argument('--headers+', dest='headersPlus', help='Additional patterns for headers.', default='')
+parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, metavar='N',
+                    help='Number of commands runned in parallel. Defaults to the number of CPUs.')
 
 args = parser.parse_args()
 
+if args.jobs < 1:
+    parser.error('--jobs must be at least 1')
+
 if not args.src:
     args.src = ['.']
 
@@ -79,10 +85,76 @@ if args.so: # shared objects require Position-Independent Code
 
 ### SEARCHING SOURCE FILES ###
 
+import re
+
+def translateGlob(pattern):
+    # same semantics as Path.match: relative patterns match trailing components,
+    # wildcards do not cross '/' boundaries, '[seq]' and '[!seq]' are classes
+    regex = ''
+    index, end = 0, len(pattern)
+    while index < end:
+        char = pattern[index]
+        index += 1
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            # like fnmatch: '!' negates, a leading ']' is literal
+            closing = index + (pattern[index:index+1] == '!')
+            closing += (pattern[closing:closing+1] == ']')
+            closing = pattern.find(']', closing)
+            if closing < 0: # unterminated class, '[' is literal
+                regex += '\\['
+            else:
+                seq = pattern[index:closing].replace('\\', '\\\\')
+                if seq.startswith('!'):
+                    seq = '^' + seq[1:]
+                elif seq.startswith('^'):
+                    seq = '\\' + seq
+                regex += '[' + seq + ']'
+                index = closing + 1
+        else:
+            regex += re.escape(char)
+    return r'(?:^|/)' + regex + r'$'
+
+def compileGlobs(patterns): # -> one regex matching any of the patterns, or None if empty
+    if not patterns:
+        return None
+    return re.compile('|'.join(translateGlob(pattern) for pattern in sorted(patterns)))
+
+# fused alternations: one C-level match per path instead of one glob per pattern
+SOURCE_PATTERNS_RE = compileGlobs(SOURCE_PATTERNS)
+SOURCE_PATTERNS_MINUS_RE = compileGlobs(SOURCE_PATTERNS_MINUS)
+HEADER_PATTERNS_RE = compileGlobs(HEADER_PATTERNS)
+
 def matchesSourcePatterns(path):
-    if all(not path.match(pattern) for pattern in SOURCE_PATTERNS):
+    text = str(path)
+    if SOURCE_PATTERNS_RE is None or SOURCE_PATTERNS_RE.search(text) is None:
         return False
-    return all(not path.match(pattern) for pattern in SOURCE_PATTERNS_MINUS)
+    return SOURCE_PATTERNS_MINUS_RE is None or SOURCE_PATTERNS_MINUS_RE.search(text) is None
+
+# a '--patterns-' entry of the form 'DIR/*' excludes a whole subtree:
+# its directory can be pruned during the walk instead of being enumerated
+EXCLUDE_DIR_PATTERNS = set()
+for pattern in SOURCE_PATTERNS_MINUS:
+    prefix, sep, last = pattern.rpartition('/')
+    if sep and last in ('*', '**'):
+        EXCLUDE_DIR_PATTERNS.add(prefix)
+EXCLUDE_DIR_RE = compileGlobs(EXCLUDE_DIR_PATTERNS)
+
+def walkSourceFiles(root):
+    # iterative os.scandir walk: DirEntry caches the file type (no stat per
+    # entry, unlike rglob) and excluded directories are not descended into
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if EXCLUDE_DIR_RE is None or EXCLUDE_DIR_RE.search(entry.path) is None:
+                        stack.append(entry.path)
+                else:
+                    yield entry.path
 
 
 SOURCE_PATHS = set()
@@ -93,35 +165,47 @@ for path in args.src:
     if not args.absolutepaths:
         path = path.relative_to(current_path)
     if path.is_dir():
-        SOURCE_PATHS.update(p for p in path.rglob('*') if matchesSourcePatterns(p))
+        # Path objects are only constructed for the files actually kept
+        SOURCE_PATHS.update(Path(p) for p in walkSourceFiles(path) if matchesSourcePatterns(p))
     else:
         if matchesSourcePatterns(path):
             SOURCE_PATHS.add(path)
 
+# output locations derive purely from the source path: compute them once,
+# without Path.resolve() which stats every path component
+OBJ_PATHS = {path: args.obj / ('./'+str(path)+'.o') for path in SOURCE_PATHS}
+HEADER_UNIT_PATHS = {path: Path('gcm.cache') / ('./'+str(path)+'.gcm') for path in SOURCE_PATHS}
+
 ### SEARCHING DEPENDENCIES ###
 
-import re
+import hashlib
+import json
+import mmap
+import sys
 from collections import defaultdict
-from dataclasses import dataclass
-
-REGEX_RELATIVE_PATH = re.compile(r'^\"([\w/\.\-\\]+)\"') # group(1) is path
-REGEX_SYSTEM_PATH = re.compile(r'^\<([\w/\.\-\\]+)\>') # group(1) is path
-REGEX_MODULE_NAME = re.compile(r'^([\w\.\:]+)') # group(1) is module name
-
-def matchRegexes(text, regexes): # -> (which, result)
-    for regex in regexes:
-        match = regex.match(text)
-        if match is not None:
-            return regex, match.group(1)
-    return None, ''
-
-@dataclass
-class SourceInfo:
-    kind: str = None
-    module_name: str = ''
-
-SOURCE_INFOS = defaultdict(SourceInfo)
-DEPENDENCIES = {} # path -> [path|modulename...]
+from concurrent.futures import ThreadPoolExecutor
+
+# the three target forms start with distinct characters ('"', '<', or a name
+# character), so one alternation classifies a target in a single match and
+# lastgroup tells which form it was
+REGEX_TARGET = re.compile(r'^(?:\"(?P<rel>[\w/\.\-\\]+)\"|\<(?P<sys>[\w/\.\-\\]+)\>|(?P<mod>[\w\.\:]+))')
+
+# one fused pattern, so each file is scanned in a single C-level pass
+# instead of one split() + several match() per line; it works on bytes so the
+# memory-mapped file is scanned in place, without decoding it into a str
+# (the interesting directives are ASCII-only)
+REGEX_DIRECTIVE = re.compile(rb'''(?m)^[ \t]*(?:
+    (?P<include>\#include)[ \t]*(?P<includetarget>"[^"\n]*"|<[^>\n]*>)
+    | (?:export[ \t]+)? (?P<import>import)[ \t]+ (?P<importtarget>[^\s;]+)
+    | (?:(?P<exportmodule>export)[ \t]+)? (?P<module>module)[ \t]+ (?P<moduletarget>[\w\.\:]+)
+    )''', re.VERBOSE)
+
+# directives legally live at the top of a translation unit: once some were
+# found, a long directive-free stretch means the code body started and the
+# rest of the file does not need to be scanned (roughly 200 lines)
+SCAN_GAP_LIMIT = 8192
+
+SCANNED_DEPENDENCIES = {} # path -> [path|modulename...], until the graph is built
 
 MODULE_PARTITIONS = defaultdict(list) # module_name -> # module_partitions
 MODULE_NAMES_TO_PATH = {}
@@ -131,103 +215,315 @@ if not args.absolutepaths:
 else:
     to_path = lambda p: p.resolve()
 
-for path in SOURCE_PATHS:
-    kind, module_name, dependencies = 'global-unit', '', [] # global-unit by default
-
-    if any(path.match(pattern) for pattern in HEADER_PATTERNS):
-        kind = 'header'
-
-    with open(path) as file:
-        content = file.read()
-
-
-    for line in content.splitlines():
-        words = line.split(maxsplit=3)
-        if not words:
-            continue
+# with --cache, scan results are persisted between invocations: a file whose
+# (mtime, size) did not change is not read nor parsed again
+DEPCACHE_PATH = args.obj / '.cpp20_depcache'
+DEPCACHE_VERSION = 2 # bump when the stored scan format changes
+# the stored kinds depend on --headers: a cache written under other header
+# patterns would serve stale kinds, so it is only reused if they match
+DEPCACHE_HEADERS = sorted(HEADER_PATTERNS)
+DEPCACHE = {} # str(path) -> {mtime_ns, size, kind, module_name, ...}
 
-        if words[0] == '#include':
-            # include declaration
-            which, match = matchRegexes(words[1], [REGEX_SYSTEM_PATH, REGEX_RELATIVE_PATH])
-            if which is REGEX_RELATIVE_PATH:
-                include_path = to_path(path.parent / match)
-                dependencies.append(include_path)
-            elif which is REGEX_SYSTEM_PATH:
-                if SOURCE_INFOS['_sys_'+match].kind is None:
-                    SOURCE_INFOS['_sys_'+match].kind = 'header'
-                dependencies.append('_sys_'+match)
-            # else invalid #include
+if args.cache:
+    try:
+        with open(DEPCACHE_PATH) as file:
+            depcache_file = json.load(file)
+        if (depcache_file.get('version') == DEPCACHE_VERSION
+                and depcache_file.get('headers') == DEPCACHE_HEADERS):
+            DEPCACHE = depcache_file['files']
+    except (OSError, ValueError):
+        pass # absent or corrupted cache, scan everything
+
+# the same path or module name appears in many dependency lists: interning
+# returns one shared object per value, so later dict lookups hit the cached
+# hash and comparisons short-circuit on identity
+PATH_POOL = {} # str -> the unique Path instance for that string
+
+def internPath(path):
+    text = str(path)
+    pooled = PATH_POOL.get(text)
+    if pooled is None:
+        PATH_POOL[text] = pooled = path
+    return pooled
 
-        elif words[0] == 'import' or (words[0] == 'export' and words[1] == 'import'):
-            imported_word = words[1] if words[0] == 'import' else words[2];
-            which, match = matchRegexes(imported_word, [REGEX_SYSTEM_PATH, REGEX_RELATIVE_PATH, REGEX_MODULE_NAME])
+for path in SOURCE_PATHS:
+    internPath(path)
+
+def encodeDep(dep): # Path and str must be distinguished once rehydrated
+    return ['P', str(dep)] if isinstance(dep, Path) else ['S', dep]
+
+def decodeDep(tag, text):
+    return Path(text) if tag == 'P' else text
+
+def encodeScanResult(result):
+    path, stat, kind, module_name, path_dependencies, name_dependencies, found_kinds, module_decls = result
+    return {'kind': kind, 'module_name': module_name,
+            'path_dependencies': [str(dep) for dep in path_dependencies],
+            'name_dependencies': name_dependencies,
+            'found_kinds': [encodeDep(key)+[found_kind] for key, found_kind in found_kinds],
+            'module_decls': module_decls}
+
+def decodeScanResult(entry):
+    return (entry['kind'], entry['module_name'],
+            [internPath(Path(text)) for text in entry['path_dependencies']],
+            [sys.intern(name) for name in entry['name_dependencies']],
+            [(decodeDep(tag, text), found_kind) for tag, text, found_kind in entry['found_kinds']],
+            [(decl_name, export) for decl_name, export in entry['module_decls']])
+
+# several files can carry the same bytes (generated stubs, copied headers):
+# the raw directives depend only on the content, so one parse is shared by
+# all files with the same digest
+PARSE_CACHE = {} # (size, sha1) -> [directive...]
+
+def parseDirectives(content):
+    # path-independent part of the scan, a pure function of the bytes;
+    # relative targets are interpreted later, against each file's location
+    directives = [] # ('include'|'import', target form, text) or ('module', export, name)
+    last_directive_end = None
+    for directive in REGEX_DIRECTIVE.finditer(content):
+        if last_directive_end is not None and directive.start() - last_directive_end > SCAN_GAP_LIMIT:
+            break
+        last_directive_end = directive.end()
+
+        if directive.group('include'):
+            target = REGEX_TARGET.match(directive.group('includetarget').decode('ascii', 'replace'))
+            if target is not None: # else invalid #include
+                directives.append(('include', target.lastgroup, target[target.lastgroup]))
+        elif directive.group('import'):
+            target = REGEX_TARGET.match(directive.group('importtarget').decode('ascii', 'replace'))
+            if target is not None: # else invalid import
+                directives.append(('import', target.lastgroup, target[target.lastgroup]))
+        else: # directive.group('module')
+            directives.append(('module', directive.group('exportmodule') is not None,
+                               sys.intern(directive.group('moduletarget').decode('ascii', 'replace'))))
+    return directives
+
+def scanOneSource(path):
+    # pure per-file scan, no shared state: files can be scanned in any order
+    # and in parallel, the results are merged afterwards
+    kind, module_name = 'global-unit', '' # global-unit by default
+    path_dependencies = [] # dependencies which are paths
+    name_dependencies = [] # dependencies which are module or '_sys_' names
+    found_kinds = [] # (path|'_sys_'+name, kind) discovered through import declarations
+    module_decls = [] # (module_name, export)
+
+    stat = path.stat()
+    entry = DEPCACHE.get(str(path))
+    if entry is not None and (entry['mtime_ns'], entry['size']) == (stat.st_mtime_ns, stat.st_size):
+        return (path, stat) + decodeScanResult(entry)
+
+    if HEADER_PATTERNS_RE is not None and HEADER_PATTERNS_RE.search(str(path)):
+        kind = 'header'
 
-            if which is REGEX_RELATIVE_PATH:
+    directives = ()
+    if stat.st_size: # mmap rejects empty files, which have no directives anyway
+        # zero-copy scan of the mapped bytes, only the short captures are decoded
+        with open(path, 'rb') as file, \
+             mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            content_key = (stat.st_size, hashlib.sha1(content).digest())
+            directives = PARSE_CACHE.get(content_key)
+            if directives is None:
+                directives = PARSE_CACHE[content_key] = parseDirectives(content)
+
+    for which, form, text in directives:
+        if which == 'include':
+            # include declaration; the target starts with '"' or '<', so its
+            # form is never 'mod'
+            if form == 'rel':
+                include_path = internPath(to_path(path.parent / text))
+                path_dependencies.append(include_path)
+            else:
+                sys_name = sys.intern('_sys_'+text)
+                found_kinds.append((sys_name, 'header'))
+                name_dependencies.append(sys_name)
+
+        elif which == 'import':
+            if form == 'rel':
                 # header-unit found
-                import_path = to_path(path.parent / match)
-                SOURCE_INFOS[import_path].kind = 'header-unit'
-                dependencies.append(import_path)
-            elif which is REGEX_SYSTEM_PATH:
+                import_path = internPath(to_path(path.parent / text))
+                found_kinds.append((import_path, 'header-unit'))
+                path_dependencies.append(import_path)
+            elif form == 'sys':
                 # system-header-unit found
-                SOURCE_INFOS['_sys_'+match].kind = 'system-header-unit'
-                dependencies.append('_sys_'+match)
-            elif which is REGEX_MODULE_NAME:
+                sys_name = sys.intern('_sys_'+text)
+                found_kinds.append((sys_name, 'system-header-unit'))
+                name_dependencies.append(sys_name)
+            else:
                 # import module found
-                if match.startswith(':'):
-                    match = module_name.split(':',maxsplit=1)[0] + match
-                dependencies.append(match)
-
-        elif module_name is not None:
-            match = None
-            export = False
-            if words[0] == 'module':
-                # module-partition or module-unit
-                match = REGEX_MODULE_NAME.match(words[1])
-            elif words[0] == 'export' and words[1] == 'module':
-                # primary-module-interface or module-partition-interface
-                match = REGEX_MODULE_NAME.match(words[2])
-                export = True
-
-            if match is not None:
-                module_name = match.group(1)
-                main_module, *partition = module_name.split(':', maxsplit=1)
-                if partition:
-                    kind = 'module-partition-interface' if export else 'module-partition'
-                    MODULE_PARTITIONS[main_module].append(module_name)
-                    MODULE_NAMES_TO_PATH[module_name] = path
-                else:
-                    kind = 'primary-module-interface' if export else 'module-unit'
-                    if export:
-                        MODULE_NAMES_TO_PATH[module_name] = path
+                if text.startswith(':'):
+                    text = module_name.split(':',maxsplit=1)[0] + text
+                name_dependencies.append(sys.intern(text))
+
+        else: # module declaration: 'form' is the export flag and 'text' the name
+            # 'module X' is a module-partition or module-unit,
+            # 'export module X' a primary-module-interface or module-partition-interface
+            export, module_name = form, text
+            main_module, *partition = module_name.split(':', maxsplit=1)
+            if partition:
+                kind = 'module-partition-interface' if export else 'module-partition'
+            else:
+                kind = 'primary-module-interface' if export else 'module-unit'
+            module_decls.append((module_name, export))
+
+    return path, stat, kind, module_name, path_dependencies, name_dependencies, found_kinds, module_decls
+
+# threads are enough here: the GIL is released during file reads
+with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1)*2) as executor:
+    scan_results = list(executor.map(scanOneSource, SOURCE_PATHS))
 
-    if SOURCE_INFOS[path].kind is None:
+if args.cache:
+    DEPCACHE = {}
+    for result in scan_results:
+        # reuse the stat taken before the file was read: re-statting here
+        # would record the mtime of a concurrent edit against the old parse
+        stat = result[1]
+        DEPCACHE[str(result[0])] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                                    **encodeScanResult(result)}
+    os.makedirs(args.obj, exist_ok=True)
+    tmp_path = DEPCACHE_PATH.with_suffix('.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump({'version': DEPCACHE_VERSION, 'headers': DEPCACHE_HEADERS, 'files': DEPCACHE}, file)
+    os.replace(tmp_path, DEPCACHE_PATH) # atomic, a concurrent reader never sees a partial cache
+
+# nodes are integer ids assigned as soon as scanning is done; the per-node
+# attributes live in parallel lists indexed by id instead of one object per
+# source file, which halves the memory spent on kinds and module names
+NODE_KEYS = [] # node id -> path|modulename
+NODE_IDS = {} # path|modulename -> node id
+NODE_KINDS = [] # node id -> kind, None while unknown
+NODE_MODULE_NAMES = [] # node id -> declared module name, '' if none
+
+def nodeId(key):
+    node = NODE_IDS.get(key)
+    if node is None:
+        node = NODE_IDS[key] = len(NODE_KEYS)
+        NODE_KEYS.append(key)
+        NODE_KINDS.append(None)
+        NODE_MODULE_NAMES.append('')
+    return node
+
+for result in scan_results:
+    nodeId(result[0]) # scanned paths first: they own the nodes [0, SCANNED_COUNT)
+SCANNED_COUNT = len(NODE_KEYS)
+
+for path, stat, kind, module_name, path_dependencies, name_dependencies, found_kinds, module_decls in scan_results:
+    for key, found_kind in found_kinds:
+        key_node = nodeId(key)
+        if found_kind != 'header' or NODE_KINDS[key_node] is None:
+            # '#include <x>' must not downgrade a system-header-unit to a plain header
+            NODE_KINDS[key_node] = found_kind
+
+    for decl_name, export in module_decls:
+        main_module, *partition = decl_name.split(':', maxsplit=1)
+        if partition:
+            MODULE_PARTITIONS[main_module].append(decl_name)
+            MODULE_NAMES_TO_PATH[decl_name] = path
+        elif export:
+            MODULE_NAMES_TO_PATH[decl_name] = path
+
+    node = NODE_IDS[path]
+    if NODE_KINDS[node] is None:
         # may be not None if already set to 'header-unit'
-        SOURCE_INFOS[path].kind = kind
+        NODE_KINDS[node] = kind
 
-    SOURCE_INFOS[path].module_name = module_name
-    DEPENDENCIES[path] = dependencies
+    NODE_MODULE_NAMES[node] = module_name
+    SCANNED_DEPENDENCIES[path] = (path_dependencies, name_dependencies)
 
 
 ### RESOLVING MODULE NAME DEPENDENCIES ###
-
-for path in DEPENDENCIES:
-    DEPENDENCIES[path] = [
-        dep if isinstance(dep, Path) else MODULE_NAMES_TO_PATH.get(dep, dep)
-        for dep in DEPENDENCIES[path]
-    ]
+from itertools import accumulate
+
+# path and name dependencies were kept apart while scanning: the names are
+# resolved in one flat bulk pass then sliced back per file, instead of an
+# isinstance test and a rebuilt list for every dependency of every file
+offsets = list(accumulate((len(names) for _, names in SCANNED_DEPENDENCIES.values()), initial=0))
+all_names = [name for _, names in SCANNED_DEPENDENCIES.values() for name in names]
+all_resolved = [MODULE_NAMES_TO_PATH.get(name, name) for name in all_names]
+for path, start, stop in zip(list(SCANNED_DEPENDENCIES), offsets, offsets[1:]):
+    path_dependencies, _ = SCANNED_DEPENDENCIES[path]
+    SCANNED_DEPENDENCIES[path] = path_dependencies + all_resolved[start:stop]
+
+### BUILDING DEPENDENCY GRAPH ###
+from array import array
+
+# compact CSR adjacency: the dependencies of node i are
+# GRAPH_INDICES[GRAPH_INDPTR[i]:GRAPH_INDPTR[i+1]], both stored as flat int arrays
+# instead of one Python list per node
+GRAPH_INDPTR = array('i', [0])
+GRAPH_INDICES = array('i')
+for dependencies in SCANNED_DEPENDENCIES.values():
+    GRAPH_INDICES.extend(nodeId(dep) for dep in dependencies)
+    GRAPH_INDPTR.append(len(GRAPH_INDICES))
+while len(GRAPH_INDPTR) <= len(NODE_KEYS):
+    GRAPH_INDPTR.append(len(GRAPH_INDICES)) # nodes only seen as dependencies: no edge
+
+def dependenciesOf(node): # -> node ids of the dependencies
+    return GRAPH_INDICES[GRAPH_INDPTR[node]:GRAPH_INDPTR[node+1]]
+
+def dependencyKeysOf(key): # -> path|modulename dependencies
+    node = NODE_IDS.get(key)
+    if node is None:
+        return []
+    return [NODE_KEYS[dep] for dep in dependenciesOf(node)]
 
 ### SORTING DEPENDENCIES ###
-from graphlib import TopologicalSorter
-
-ORDER = [] # list of steps, each step being a list of paths dependent on the previous steps only
-
-topological_sorter = TopologicalSorter(DEPENDENCIES)
-topological_sorter.prepare()
-while topological_sorter.is_active():
-    step = topological_sorter.get_ready()
-    ORDER.append(step)
-    for path in step:
-        topological_sorter.done(path)
+from graphlib import CycleError
+
+def kahnLevelOrder(indptr, indices, keys):
+    # Kahn's algorithm as a tight kernel over the CSR arrays: everything is
+    # a local binding and edges are walked by index, so no per-node slice
+    # or list is allocated while sorting
+    node_count = len(keys)
+
+    # transposed CSR (dependents of each node) by counting sort; counts are
+    # shifted so rev_indptr[dep+1] doubles as the fill cursor of row 'dep'
+    rev_indptr = array('i', bytes(4*(node_count+2)))
+    for dep in indices:
+        rev_indptr[dep+2] += 1
+    for node in range(2, node_count+2):
+        rev_indptr[node] += rev_indptr[node-1]
+    rev_indices = array('i', bytes(4*len(indices)))
+    for node in range(node_count):
+        for edge in range(indptr[node], indptr[node+1]):
+            dep = indices[edge]
+            rev_indices[rev_indptr[dep+1]] = node
+            rev_indptr[dep+1] += 1
+
+    # one flat static order, the queue is consumed in place
+    in_degree = array('i', (indptr[node+1]-indptr[node] for node in range(node_count)))
+    static_order = [node for node in range(node_count) if in_degree[node] == 0]
+    push = static_order.append
+    head = 0
+    while head < len(static_order):
+        node = static_order[head]
+        head += 1
+        for edge in range(rev_indptr[node], rev_indptr[node+1]):
+            dependent = rev_indices[edge]
+            in_degree[dependent] -= 1
+            if in_degree[dependent] == 0:
+                push(dependent)
+    if len(static_order) != node_count:
+        raise CycleError('nodes are in a cycle',
+                         [keys[node] for node in range(node_count) if in_degree[node] > 0])
+
+    # a single pass then groups the static order by level:
+    # a node goes one step after its deepest dependency
+    order = []
+    node_level = array('i', bytes(4*node_count))
+    for node in static_order:
+        level = 0
+        for edge in range(indptr[node], indptr[node+1]):
+            dep_level = node_level[indices[edge]]
+            if dep_level >= level:
+                level = dep_level + 1
+        node_level[node] = level
+        if level == len(order):
+            order.append([])
+        order[level].append(keys[node])
+    return order
+
+# list of steps, each step being a list of paths dependent on the previous steps only
+ORDER = kahnLevelOrder(GRAPH_INDPTR, GRAPH_INDICES, NODE_KEYS)
 
 ### BUILDING COMMANDS ###
 COMMANDS = []
@@ -239,43 +535,84 @@ objs = []
 to_be_build = set()
 
 if args.cache:
+    # mtimes are gathered with one scandir per directory, instead of
+    # one stat syscall per file per dependency list it appears in
+    MTIME_CACHE = {} # path -> st_mtime_ns
+    STATTED_DIRS = set()
+
+    def mtimeOf(path):
+        directory = path.parent
+        if directory not in STATTED_DIRS:
+            STATTED_DIRS.add(directory)
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if not entry.is_dir(follow_symlinks=False):
+                            MTIME_CACHE[directory / entry.name] = entry.stat().st_mtime_ns
+            except OSError:
+                pass # absent directory: no file in it is up to date
+        return MTIME_CACHE.get(path)
+
     def uptodate(path, deps):
-        if not path.is_file():
+        mytime = mtimeOf(path)
+        if mytime is None: # does not exist
             return False
-        mytime = path.stat().st_mtime
-        return all((not d in to_be_build and d.stat().st_mtime < mytime) for d in deps if isinstance(d, Path))
+        for dep in deps:
+            if isinstance(dep, Path):
+                deptime = mtimeOf(dep)
+                if dep in to_be_build or deptime is None or deptime >= mytime:
+                    return False
+        return True
 else:
     def uptodate(path, deps):
         return False
 
+# one walk of gcm.cache indexes the precompiled system headers, instead of a
+# recursive glob('**/NAME.*') per system-header-unit inside the command loop;
+# every trailing sub-path is indexed since NAME may contain '/' (<sys/types.h>)
+GCM_INDEX = set()
+if args.cache:
+    for gcm_path in Path('gcm.cache').rglob('*.*'):
+        name = gcm_path.name
+        key = name[:name.rindex('.')]
+        GCM_INDEX.add(key)
+        for part in reversed(gcm_path.relative_to('gcm.cache').parent.parts):
+            key = part + '/' + key
+            GCM_INDEX.add(key)
+
 for step in ORDER:
     stepcmds = []
     for path in step:
-        kind = SOURCE_INFOS[path].kind
+        kind = NODE_KINDS[NODE_IDS[path]]
         if kind == 'header':
             continue # not compiling header and header-units
         elif kind == 'header-unit':
             # potential gcm cache
-            header_unit_path = (Path('gcm.cache/') / ('./'+str(path)+'.gcm')).resolve()
-            if uptodate(header_unit_path, DEPENDENCIES.get(path, [])+[path]):
+            header_unit_path = HEADER_UNIT_PATHS.get(path)
+            if header_unit_path is None: # dependency which was not among the scanned sources
+                header_unit_path = HEADER_UNIT_PATHS[path] = Path('gcm.cache') / ('./'+str(path)+'.gcm')
+            if uptodate(header_unit_path, dependencyKeysOf(path)+[path]):
                 continue
             to_be_build.add(path)
             stepcmds.append(cmd_hu.format(src=path))
         elif kind == 'system-header-unit':
-            if args.cache and len(list(Path('gcm.cache').glob(f'**/{path.removeprefix("_sys_")}.*'))) > 0:
+            if path.removeprefix('_sys_') in GCM_INDEX:
                 continue
             to_be_build.add(path)
             stepcmds.append(cmd_syshu.format(src=path.removeprefix('_sys_')))
         else:
-            obj = str((args.obj / ('./'+str(path))).resolve()) + '.o'
-            objs.append(obj)
-            obj = Path(obj)
+            obj = OBJ_PATHS.get(path)
+            if obj is None: # dependency which was not among the scanned sources
+                obj = OBJ_PATHS[path] = args.obj / ('./'+str(path)+'.o')
+            objs.append(str(obj))
             OUTDIRS.add(obj.parent)
-            if uptodate(obj, DEPENDENCIES.get(path, [])+[path]):
+            if uptodate(obj, dependencyKeysOf(path)+[path]):
                 continue
             to_be_build.add(path)
             stepcmds.append(cmd_obj.format(src=path,obj=obj))
-    COMMANDS.append(sorted(stepcmds))
+    # order within a step is irrelevant for correctness and the parallel
+    # runner dispatches them as given: no need to sort here
+    COMMANDS.append(stepcmds)
 # append final link command
 if args.lib:
     COMMANDS.append([cmd_lib.format(objs=' '.join(objs), out=args.lib)])
@@ -293,18 +630,32 @@ for showoption in args.show.split(','):
     if showoption == '':
         continue
     elif showoption == 'list':
-        for path, sourceinfo in sorted(SOURCE_INFOS.items(), key=lambda p:str(p[0])):
-            print(f'"{path}", {sourceinfo.kind}, {sourceinfo.module_name}')
+        # writelines on a fragment generator: one stdout call instead of one
+        # locked print per source file; sort on tuples to skip repeated str()
+        items = sorted(zip(NODE_KEYS, NODE_KINDS, NODE_MODULE_NAMES),
+                       key=lambda kv: getattr(kv[0], 'parts', (kv[0],)))
+        def lines():
+            for path, kind, module_name in items:
+                yield '"'; yield str(path); yield '", '
+                yield str(kind); yield ', '; yield module_name; yield '\n'
+        sys.stdout.writelines(lines())
     elif showoption == 'deps':
-        for path, deps in sorted(DEPENDENCIES.items(), key=lambda p:str(p[0])):
-            deps = [ f'"{dep}"' for dep in deps]
-            print(f'"{path}",', ', '.join(deps))
+        names = [str(key) for key in NODE_KEYS] # converted once, not per comparison
+        def lines():
+            for node in sorted(range(SCANNED_COUNT), key=names.__getitem__):
+                yield '"'; yield names[node]; yield '", '
+                yield ', '.join('"' + names[dep] + '"' for dep in dependenciesOf(node))
+                yield '\n'
+        sys.stdout.writelines(lines())
     elif showoption == 'order':
-        for step in ORDER:
-            print(', '.join(f'"{path}"' for path in step))
+        def lines():
+            for step in ORDER:
+                yield ', '.join('"' + str(path) + '"' for path in step)
+                yield '\n'
+        sys.stdout.writelines(lines())
     elif showoption == 'cmd':
         for stepcmds in COMMANDS:
-            for cmd in stepcmds:
+            for cmd in sorted(stepcmds): # sorted only for reproducible output
                 print(cmd)
             print()
     print()
@@ -315,16 +666,55 @@ if args.nobuild:
 
 ### RUNNING COMMANDS ###
 import subprocess
+import tempfile
+import time
+
+def runStep(stepcmds):
+    # sliding window of at most --jobs processes, as make -j schedules: no
+    # worker thread and no pipe to drain per command; stderr is spooled to a
+    # temporary file which is only read back when the command fails
+    running = [] # [(process, cmd, stderr file)...]
+    failure = None
+
+    def reap(process, cmd, stderr_file):
+        nonlocal failure
+        with stderr_file:
+            if process.wait() != 0 and failure is None:
+                stderr_file.seek(0)
+                failure = RuntimeError(f'Command returned status {process.returncode}: {cmd}\n'
+                                       + stderr_file.read().decode())
+
+    for cmd in stepcmds:
+        while len(running) >= args.jobs and failure is None:
+            # wait for a slot: reap the finished processes, if any
+            still_running = []
+            for item in running:
+                if item[0].poll() is None:
+                    still_running.append(item)
+                else:
+                    reap(*item)
+            if len(still_running) == len(running):
+                time.sleep(0.005)
+            running = still_running
+        if failure is not None:
+            break # abort the step, commands not started yet are dropped
+        stderr_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        running.append((process, cmd, stderr_file))
+
+    for item in running: # barrier: the next step depends on this one
+        reap(*item)
+    if failure is not None:
+        raise failure
+
 try:
     if not args.cache:
         # not reusing objects and header units
         subprocess.run(cmd_rm.format(f'{args.obj} gcm.cache'), shell=True, capture_output=True)
 
+    # commands within a step are independent, only steps must be sequential
     for stepcmds in COMMANDS:
-        for cmd in stepcmds:
-            result = subprocess.run(cmd, shell=True,capture_output=True)
-            if result.returncode != 0:
-                raise RuntimeError(f'Command returned status {result.returncode}: {cmd}\n{result.stderr.decode()}')
+        runStep(stepcmds)
 finally:
     if not args.keep:
         subprocess.run(cmd_rm.format(f'{args.obj} gcm.cache'), shell=True)